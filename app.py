@@ -4,13 +4,14 @@ A comprehensive Streamlit app with Google Sheets integration
 """
 
 import streamlit as st
-import pandas as pd
 from datetime import datetime, timedelta
 import json
 import io
 import os
-from streamlit_searchbox import st_searchbox
-from db_mongodb import get_mongodb_client
+import re
+from concurrent.futures import ThreadPoolExecutor, wait
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from db_mongodb import get_mongodb_client, DuplicateCustomerError, TeaDBError
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -34,6 +35,13 @@ TEA_TYPES = ["Mix", "Barik"]
 VILLAGES = ["vairgwadi", "Bardwadi", "Harali KH", "Harali BK"]
 DAYS_OF_WEEK = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
 PAYMENT_OPTIONS = ["Paid", "Half paid", "Not paid"]
+CATEGORY_COLUMNS = ["Village", "Tea Type", "Packaging", "Payment Status", "Day", "Brand"]
+
+# Option -> position maps for selectbox defaults (O(1) instead of list.index)
+TEA_TYPE_INDEX = {tea: i for i, tea in enumerate(TEA_TYPES)}
+VILLAGE_INDEX = {village: i for i, village in enumerate(VILLAGES)}
+DAY_INDEX = {day: i for i, day in enumerate(DAYS_OF_WEEK)}
+PAYMENT_INDEX = {status: i for i, status in enumerate(PAYMENT_OPTIONS)}
 
 DAY_TO_VILLAGE = {
     "Monday": "Harali KH",
@@ -54,7 +62,7 @@ DEFAULT_PRICING = {
 # ============================================
 # CUSTOM CSS FOR BETTER UI
 # ============================================
-st.markdown("""
+CUSTOM_CSS = """
 <style>
     /* Main container */
     .main .block-container {
@@ -71,53 +79,6 @@ st.markdown("""
         color: white;
     }
     
-    /* Cards */
-    .metric-card {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        padding: 20px;
-        border-radius: 15px;
-        color: white;
-        text-align: center;
-        box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-    }
-    
-    .metric-card h3 {
-        margin: 0;
-        font-size: 2rem;
-    }
-    
-    .metric-card p {
-        margin: 5px 0 0 0;
-        opacity: 0.9;
-    }
-    
-    /* Success card */
-    .success-card {
-        background: linear-gradient(135deg, #11998e 0%, #38ef7d 100%);
-        padding: 20px;
-        border-radius: 15px;
-        color: white;
-        text-align: center;
-    }
-    
-    /* Warning card */
-    .warning-card {
-        background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);
-        padding: 20px;
-        border-radius: 15px;
-        color: white;
-        text-align: center;
-    }
-    
-    /* Info card */
-    .info-card {
-        background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%);
-        padding: 20px;
-        border-radius: 15px;
-        color: white;
-        text-align: center;
-    }
-    
     /* Page title */
     .page-title {
         background: linear-gradient(90deg, #1a472a 0%, #2d5a3d 100%);
@@ -146,7 +107,17 @@ st.markdown("""
         border-radius: 8px;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+@st.cache_resource
+def compile_css(css):
+    """Strip comments and indentation so the CSS payload sent per rerun is minimal"""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.DOTALL)
+    return "".join(line.strip() for line in css.splitlines())
+
+# Streamlit drops any element that is not re-emitted during a rerun,
+# so the (compiled, cached) stylesheet is written on every run.
+st.markdown(compile_css(CUSTOM_CSS), unsafe_allow_html=True)
 
 # ============================================
 # AUTHENTICATION
@@ -223,6 +194,9 @@ def init_mongodb():
         # Initialize default pricing if not exists
         db_manager.initialize_default_pricing(DEFAULT_PRICING)
         
+        # Make sure the query indexes exist
+        db_manager.ensure_indexes()
+        
         return db_manager
     except Exception as e:
         st.error(f"❌ MongoDB initialization error: {str(e)}")
@@ -231,84 +205,111 @@ def init_mongodb():
 # ============================================
 # DATA FUNCTIONS
 # ============================================
-@st.cache_data(ttl=30)
-def load_sales_data(_db_manager=None):
+def sales_frame(sales):
+    """Build the typed sales DataFrame every page reads from a list of sale documents"""
+    import pandas as pd
+    
+    if not sales:
+        return pd.DataFrame(columns=[
+            "ID", "Date", "Day", "Village", "Customer Name", "Brand",
+            "Tea Type", "Packaging", "Rate", "Quantity", "Total Amount",
+            "Payment Status", "Amount Paid", "Balance"
+        ])
+    
+    # Convert MongoDB documents to DataFrame
+    df = pd.DataFrame(sales)
+    # ObjectId strings are what update_sale/delete_sale expect back
+    if '_id' in df.columns:
+        df['_id'] = df['_id'].astype(str)
+    
+    # Rename columns to match old format (capitalize first letter)
+    column_mapping = {
+        '_id': 'ID',
+        'date': 'Date',
+        'day': 'Day',
+        'village': 'Village',
+        'customer_name': 'Customer Name',
+        'brand': 'Brand',
+        'tea_type': 'Tea Type',
+        'packaging': 'Packaging',
+        'rate': 'Rate',
+        'quantity': 'Quantity',
+        'total_amount': 'Total Amount',
+        'payment_status': 'Payment Status',
+        'amount_paid': 'Amount Paid',
+        'balance': 'Balance',
+        'created_at': 'Created At',
+        'updated_at': 'Updated At'
+    }
+    df = df.rename(columns=column_mapping)
+    
+    # Parse dates once here so pages only read precomputed columns
+    if 'Date' in df.columns:
+        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+        # Day-resolution datetime64 so date filters are plain numeric compares
+        df['_date_day'] = df['Date'].values.astype('datetime64[D]')
+        df['_month'] = df['Date'].dt.month
+        df['_year'] = df['Date'].dt.year
+        df['_week'] = df['Date'].dt.isocalendar().week
+        df['_ym'] = df['Date'].dt.to_period('M').astype(str)
+    
+    # 32-bit numbers halve the memory moved by sums and groupbys
+    for col in ('Total Amount', 'Amount Paid', 'Rate', 'Balance'):
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype('float32')
+    if 'Quantity' in df.columns:
+        df['Quantity'] = pd.to_numeric(df['Quantity'], errors='coerce').fillna(0).astype('int32')
+    
+    # Outstanding balance per sale, computed once (fully paid sales owe nothing)
+    if {'Total Amount', 'Amount Paid', 'Payment Status'} <= set(df.columns):
+        df['_unpaid'] = df['Payment Status'].ne('Paid')
+        balance = df['Total Amount'] - df['Amount Paid']
+        df['Balance'] = balance.where(df['_unpaid'], 0).astype('float32')
+    
+    # Low-cardinality labels as categoricals so groupbys run on integer codes
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+@st.cache_data(ttl=120)  # Keyed on the sales data version; the TTL only picks up edits made elsewhere
+def load_sales_data(_db_manager=None, data_version=0):
     """Load all sales data from MongoDB"""
     if _db_manager:
         try:
-            sales = _db_manager.get_all_sales()
-            if sales:
-                # Convert MongoDB documents to DataFrame
-                df = pd.DataFrame(sales)
-                
-                # Convert date strings to datetime
-                if 'date' in df.columns:
-                    df['date'] = pd.to_datetime(df['date'], errors='coerce')
-                
-                # Rename columns to match old format (capitalize first letter)
-                column_mapping = {
-                    'sale_id': 'ID',
-                    'date': 'Date',
-                    'day': 'Day',
-                    'village': 'Village',
-                    'customer_name': 'Customer Name',
-                    'brand': 'Brand',
-                    'tea_type': 'Tea Type',
-                    'packaging': 'Packaging',
-                    'rate': 'Rate',
-                    'quantity': 'Quantity',
-                    'total_amount': 'Total Amount',
-                    'payment_status': 'Payment Status',
-                    'amount_paid': 'Amount Paid',
-                    'balance': 'Balance',
-                    'created_at': 'Created At',
-                    'updated_at': 'Updated At'
-                }
-                df = df.rename(columns=column_mapping)
-                return df
+            return sales_frame(_db_manager.get_all_sales())
         except Exception as e:
             st.error(f"Error loading sales: {str(e)}")
     
-    return pd.DataFrame(columns=[
-        "ID", "Date", "Day", "Village", "Customer Name", "Brand",
-        "Tea Type", "Packaging", "Rate", "Quantity", "Total Amount",
-        "Payment Status", "Amount Paid", "Balance", "Created At", "Updated At"
-    ])
+    return sales_frame([])
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes to reduce API calls
-def load_customers_data(_db_manager=None):
+@st.cache_data(ttl=300)  # Keyed on the customers data version; writes bump it
+def load_customers_data(_db_manager=None, data_version=0):
     """Load customers from MongoDB and local JSON file"""
-    # First, load from local JSON file
-    customers = load_default_customers()
+    # First, load from local JSON file (read-only tuples, shared as-is)
+    customers = dict(load_default_customers())
     
     # Then merge with MongoDB data if available
     if _db_manager:
         try:
             mongo_customers = _db_manager.get_all_customers()
             for village, customer_list in mongo_customers.items():
-                if village not in customers:
-                    customers[village] = []
-                for customer in customer_list:
-                    if customer not in customers[village]:
-                        customers[village].append(customer)
+                known = customers.get(village, ())
+                extra = [c for c in dict.fromkeys(customer_list) if c not in known]
+                # Only villages with new names get a fresh tuple
+                if extra:
+                    customers[village] = known + tuple(extra)
         except Exception as e:
             st.warning(f"Could not load from MongoDB: {str(e)}")
     
     return customers
 
-@st.cache_data(ttl=60)
-def load_pricing_data(_db_manager=None):
-    """Load pricing from MongoDB"""
-    if _db_manager:
-        try:
-            pricing = _db_manager.get_all_pricing()
-            if pricing:
-                return pricing
-        except Exception as e:
-            st.error(f"Error loading pricing: {str(e)}")
-    
-    return DEFAULT_PRICING.copy()
+@st.cache_resource  # Only changes through update_pricing, which clears it
+def load_pricing_data(_db_manager):
+    """Load pricing from MongoDB (errors propagate so a failed read is never cached)"""
+    return _db_manager.get_all_pricing() or DEFAULT_PRICING.copy()
 
+@st.cache_resource  # Re-read only when this app rewrites the JSON file
 def load_default_customers():
     """Load customer list from customer_database.json file"""
     # Try to load from customer_database.json file
@@ -316,10 +317,8 @@ def load_default_customers():
     try:
         with open(json_path, 'r', encoding='utf-8') as f:
             customers = json.load(f)
-            # Strip whitespace from customer names
-            for village in customers:
-                customers[village] = [name.strip() for name in customers[village]]
-            return customers
+            # Strip whitespace from customer names; tuples keep the shared copy read-only
+            return {village: tuple(name.strip() for name in names) for village, names in customers.items()}
     except FileNotFoundError:
         st.warning("customer_database.json not found, using default customers")
     except json.JSONDecodeError as e:
@@ -327,10 +326,10 @@ def load_default_customers():
     
     # Fallback to hardcoded defaults if file not found
     return {
-        "vairgwadi": [],
-        "Bardwadi": [],
-        "Harali KH": [],
-        "Harali BK": []
+        "vairgwadi": (),
+        "Bardwadi": (),
+        "Harali KH": (),
+        "Harali BK": ()
     }
 
 def save_customer_to_json(village, customer_name):
@@ -352,20 +351,31 @@ def save_customer_to_json(village, customer_name):
             # Save back to file
             with open(json_path, 'w', encoding='utf-8') as f:
                 json.dump(customers, f, indent=4, ensure_ascii=False)
+            load_default_customers.clear()
             return True
     except Exception as e:
         st.error(f"Error saving customer to JSON: {e}")
     return False
 
+@st.cache_data
+def lowercase_customers(village, customer_names):
+    """Lowercased customer names for a village, computed once instead of per keystroke"""
+    return [name.lower() for name in customer_names]
+
+@st.cache_data
+def customer_name_set(village, customer_names):
+    """Whitespace-trimmed customer names for a village, for O(1) membership checks"""
+    return frozenset(name.strip() for name in customer_names)
+
 def search_customers(search_term, village, customers):
     """Search function for customer autocomplete"""
     if not search_term or len(search_term) < 2:
         # Return all customers for the village when less than 2 characters
-        customer_list = customers.get(village, [])
-        return customer_list[:10]  # Limit to 10 suggestions
+        customer_list = customers.get(village, ())
+        return list(customer_list[:10])  # Limit to 10 suggestions
     
     # Filter customers based on search term
-    customer_list = customers.get(village, [])
+    customer_list = customers.get(village, ())
     search_lower = search_term.lower()
     matches = [c for c in customer_list if search_lower in c.lower()]
     
@@ -398,10 +408,10 @@ def save_sale(db_manager, sale_data):
             success = db_manager.add_sale(mongo_data)
             if success:
                 # Clear cache to refresh data
-                load_sales_data.clear()
+                bump_data_version("sales")
             return success
-        except Exception as e:
-            st.error(f"Error saving sale: {str(e)}")
+        except TeaDBError as e:
+            st.error(str(e))
             return False
     return False
 
@@ -427,10 +437,23 @@ def update_sale(db_manager, sale_id, updated_data):
             
             success = db_manager.update_sale(sale_id, mongo_data)
             if success:
-                load_sales_data.clear()
+                bump_data_version("sales")
             return success
-        except Exception as e:
-            st.error(f"Error updating sale: {str(e)}")
+        except TeaDBError as e:
+            st.error(str(e))
+            return False
+    return False
+
+def record_payment(db_manager, sale_id, amount):
+    """Record a payment against a sale in MongoDB"""
+    if db_manager:
+        try:
+            success = db_manager.record_payment(sale_id, amount)
+            if success:
+                bump_data_version("sales")
+            return success
+        except TeaDBError as e:
+            st.error(str(e))
             return False
     return False
 
@@ -440,10 +463,10 @@ def delete_sale(db_manager, sale_id):
         try:
             success = db_manager.delete_sale(sale_id)
             if success:
-                load_sales_data.clear()
+                bump_data_version("sales")
             return success
-        except Exception as e:
-            st.error(f"Error deleting sale: {str(e)}")
+        except TeaDBError as e:
+            st.error(str(e))
             return False
     return False
 
@@ -453,10 +476,13 @@ def add_customer(db_manager, village, customer_name):
         try:
             success = db_manager.add_customer(village, customer_name)
             if success:
-                load_customers_data.clear()
+                bump_data_version("customers")
             return success
-        except Exception as e:
-            st.error(f"Error adding customer: {str(e)}")
+        except DuplicateCustomerError as e:
+            st.warning(str(e))
+            return False
+        except TeaDBError as e:
+            st.error(str(e))
             return False
     return False
 
@@ -469,9 +495,9 @@ def delete_customer(db_manager, village, customer_name):
         try:
             deleted = db_manager.delete_customer(village, customer_name)
             if deleted:
-                load_customers_data.clear()
-        except Exception as e:
-            st.error(f"Error deleting customer from MongoDB: {str(e)}")
+                bump_data_version("customers")
+        except TeaDBError as e:
+            st.error(str(e))
             return False
     
     # Also delete from local JSON file
@@ -488,6 +514,8 @@ def delete_customer(db_manager, village, customer_name):
             # Save back to file
             with open(json_path, 'w', encoding='utf-8') as f:
                 json.dump(customers, f, indent=4, ensure_ascii=False)
+            load_default_customers.clear()
+            bump_data_version("customers")
             deleted = True
     except Exception as e:
         st.warning(f"Could not update local customer database: {e}")
@@ -498,14 +526,18 @@ def edit_customer(db_manager, village, old_name, new_name):
     """Edit a customer name in MongoDB"""
     if db_manager:
         try:
-            success = db_manager.update_customer(village, old_name, new_name)
-            if success:
-                load_customers_data.clear()
-                # Also update in local JSON file
-                save_customer_to_json(village, new_name.strip())
-            return success
-        except Exception as e:
-            st.error(f"Error editing customer: {str(e)}")
+            updated = db_manager.update_customer(village, old_name, new_name)
+            if updated is None:
+                st.warning(f"Customer '{old_name}' was not found in {village}")
+                return False
+            bump_data_version("customers")
+            # Also update in local JSON file
+            save_customer_to_json(village, updated['customer_name'])
+            return True
+        except DuplicateCustomerError as e:
+            st.warning(str(e))
+        except TeaDBError as e:
+            st.error(str(e))
     return False
 
 def update_pricing(db_manager, package, new_rate):
@@ -515,11 +547,171 @@ def update_pricing(db_manager, package, new_rate):
             success = db_manager.update_pricing(package, new_rate)
             if success:
                 load_pricing_data.clear()
+                bump_data_version("pricing")
             return success
-        except Exception as e:
-            st.error(f"Error updating pricing: {str(e)}")
+        except TeaDBError as e:
+            st.error(str(e))
     return False
 
+def prefetch(db_manager):
+    """Warm the sales, customers and pricing caches concurrently"""
+    # Worker threads need the script context to use st.cache_* and report errors
+    ctx = get_script_run_ctx()
+    with ThreadPoolExecutor(3, initializer=add_script_run_ctx, initargs=(None, ctx)) as executor:
+        futures = [
+            executor.submit(load_sales_data, db_manager, get_data_version("sales")),
+            executor.submit(load_customers_data, db_manager, get_data_version("customers")),
+            executor.submit(load_pricing_data, db_manager)
+        ]
+        # Pricing errors are not cached; sync_session_pricing retries and reports them
+        wait(futures)
+
+# ============================================
+# CACHED VIEWS
+# ============================================
+@st.cache_resource
+def get_data_versions():
+    """Process-wide write counters, shared by all sessions and used as cache keys"""
+    return {"sales": 0, "customers": 0, "pricing": 0}
+
+def get_data_version(name):
+    """Current write counter for a data set"""
+    return get_data_versions()[name]
+
+def bump_data_version(name):
+    """Mark cached views keyed on this data set as outdated after a write"""
+    get_data_versions()[name] += 1
+
+def sync_session_pricing(db_manager):
+    """Keep pricing in session state, reloading it only after a pricing update"""
+    version = get_data_version("pricing")
+    if st.session_state.get('pricing_version') != version:
+        try:
+            pricing = load_pricing_data(db_manager)
+        except TeaDBError as e:
+            # Use the defaults for this run only; the version stays unset so the next run retries
+            st.error(str(e))
+            pricing = DEFAULT_PRICING.copy()
+            version = None
+        st.session_state['pricing'] = pricing
+        st.session_state['packaging_keys'] = list(pricing.keys())
+        st.session_state['packaging_index'] = {package: i for i, package in enumerate(pricing)}
+        st.session_state['pricing_version'] = version
+
+@st.cache_data(ttl=60)
+def todays_stats(_db_manager, data_version, today):
+    """(sales count, revenue) for today, summed in MongoDB"""
+    day = today.strftime("%Y-%m-%d")
+    try:
+        summary = _db_manager.get_sales_summary(day, day)
+    except TeaDBError as e:
+        st.error(str(e))
+        return 0, 0.0
+    return int(summary['count']), float(summary['total'])
+
+@st.cache_data(ttl=60)
+def sales_count(_db_manager, data_version):
+    """Number of sales, from collection metadata rather than loading them"""
+    try:
+        return _db_manager.count_sales()
+    except TeaDBError as e:
+        st.error(str(e))
+        return 0
+
+@st.cache_data(ttl=120)
+def filter_by_period(_db_manager, data_version, period, today):
+    """Sales rows falling in the dashboard period"""
+    import numpy as np
+    
+    df = load_sales_data(_db_manager, data_version)
+    if 'Date' not in df.columns:
+        return df
+    
+    if period == "Today":
+        return df[df['_date_day'] == np.datetime64(today)]
+    elif period == "This Week":
+        week_start = today - timedelta(days=today.weekday())
+        return df[df['_date_day'] >= np.datetime64(week_start)]
+    elif period == "This Month":
+        return df[(df['_month'] == today.month) & (df['_year'] == today.year)]
+    return df
+
+@st.cache_data(ttl=120)
+def all_report_aggregates(_db_manager, data_version):
+    """Every report table computed together, so switching reports is a dict lookup"""
+    df = load_sales_data(_db_manager, data_version)
+    totals = {'Total Amount': 'sum', 'Quantity': 'sum', 'ID': 'count'}
+    totals_with_balance = {**totals, 'Balance': 'sum'}
+    reports = {}
+    
+    if 'Date' in df.columns:
+        weekly = df.groupby(['_year', '_week'], observed=True).agg(totals)
+        reports['weekly'] = weekly.rename(columns={'ID': 'Orders'}).reset_index().rename(columns={'_year': 'Year', '_week': 'Week'})
+        
+        monthly = df.groupby('_ym', observed=True).agg(totals)
+        reports['monthly'] = monthly.rename(columns={'ID': 'Orders'}).reset_index().rename(columns={'_ym': 'Month'})
+    
+    if 'Customer Name' in df.columns:
+        customer = df.groupby('Customer Name', observed=True, sort=False).agg(totals_with_balance)
+        customer = customer.rename(columns={'ID': 'Orders'}).reset_index()
+        reports['customer'] = customer.sort_values('Total Amount', ascending=False)
+    
+    if 'Tea Type' in df.columns and 'Packaging' in df.columns:
+        # One pass over the sales, then roll the small product table up each way
+        product = df.groupby(['Tea Type', 'Packaging'], observed=True, sort=False)[['Total Amount', 'Quantity']].sum()
+        reports['tea'] = product.groupby(level='Tea Type', observed=True, sort=False).sum().reset_index()
+        reports['packaging'] = product.groupby(level='Packaging', observed=True, sort=False).sum().reset_index()
+    
+    return reports
+
+@st.cache_data(ttl=120)
+def daily_sales_summary(_db_manager, data_version):
+    """Daily totals grouped in MongoDB, so only one row per day crosses the wire"""
+    import pandas as pd
+    
+    try:
+        rows = _db_manager.aggregate_sales(('date',), ('total_amount', 'quantity'))
+    except TeaDBError as e:
+        st.error(str(e))
+        rows = []
+    daily = pd.DataFrame(rows, columns=['date', 'total_amount', 'quantity', 'orders']).rename(columns={
+        'date': 'Date',
+        'total_amount': 'Total Amount',
+        'quantity': 'Quantity',
+        'orders': 'Orders'
+    })
+    daily['Date'] = pd.to_datetime(daily['Date'], errors='coerce')
+    daily = daily.dropna(subset=['Date']).sort_values('Date', ascending=False)
+    daily['Date'] = daily['Date'].dt.date
+    return daily
+
+@st.cache_data(ttl=120)
+def village_sales_summary(_db_manager, data_version):
+    """Village totals grouped in MongoDB, one row per village"""
+    import pandas as pd
+    
+    try:
+        rows = _db_manager.get_sales_by_village()
+    except TeaDBError as e:
+        st.error(str(e))
+        rows = []
+    return pd.DataFrame(rows, columns=['village', 'total_amount', 'quantity', 'orders', 'balance']).rename(columns={
+        'village': 'Village',
+        'total_amount': 'Total Amount',
+        'quantity': 'Quantity',
+        'orders': 'Orders',
+        'balance': 'Balance'
+    })
+
+@st.cache_data(ttl=120)
+def pending_frame(_db_manager, data_version):
+    """Sales that are not fully paid, fetched through the (payment_status, date) index"""
+    try:
+        return sales_frame(_db_manager.get_pending_sales())
+    except TeaDBError as e:
+        st.error(str(e))
+        return sales_frame([])
+
 # ============================================
 # HELPER FUNCTIONS
 # ============================================
@@ -531,6 +723,32 @@ def generate_id():
     """Generate unique ID"""
     return datetime.now().strftime("%Y%m%d%H%M%S")
 
+def export_frame(df):
+    """Drop the precomputed helper columns (prefixed with _) before exporting"""
+    return df[[col for col in df.columns if not col.startswith('_')]]
+
+def to_excel_bytes(df, sheet_name):
+    """Serialize a frame to .xlsx bytes, streaming it row by row through xlsxwriter"""
+    import xlsxwriter
+    
+    df = export_frame(df)
+    buffer = io.BytesIO()
+    # constant_memory flushes each row once the next one starts, so rows are
+    # written strictly in order here (pandas' to_excel writes column by column)
+    workbook = xlsxwriter.Workbook(buffer, {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd',
+        'nan_inf_to_errors': True,
+        'remove_timezone': True
+    })
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, list(df.columns))
+    values = df.astype(object).where(df.notna(), None)
+    for row_num, row in enumerate(values.itertuples(index=False), start=1):
+        worksheet.write_row(row_num, 0, row)
+    workbook.close()
+    return buffer.getvalue()
+
 # ============================================
 # PAGE FUNCTIONS
 # ============================================
@@ -559,15 +777,11 @@ def render_sidebar():
         
         # Quick stats
         if 'db_manager' in st.session_state and st.session_state.db_manager:
-            df = load_sales_data(st.session_state.db_manager)
-            if not df.empty:
-                today = datetime.now().date()
-                today_sales = df[pd.to_datetime(df['Date']).dt.date == today] if 'Date' in df.columns else pd.DataFrame()
-                
-                st.markdown("### 📈 Today's Stats")
-                st.metric("Sales", len(today_sales))
-                if not today_sales.empty and 'Total Amount' in today_sales.columns:
-                    st.metric("Revenue", f"₹{today_sales['Total Amount'].sum():,.0f}")
+            today_count, today_revenue = todays_stats(st.session_state.db_manager, get_data_version("sales"), datetime.now().date())
+            st.markdown("### 📈 Today's Stats")
+            st.metric("Sales", today_count)
+            if today_count:
+                st.metric("Revenue", f"₹{today_revenue:,.0f}")
         
         st.markdown("---")
         
@@ -588,7 +802,8 @@ def render_dashboard(db_manager):
     """Render the dashboard page"""
     st.markdown("<div class='page-title'><h2>🏠 Dashboard</h2></div>", unsafe_allow_html=True)
     
-    df = load_sales_data(db_manager)
+    version = get_data_version("sales")
+    df = load_sales_data(db_manager, version)
     
     if df.empty:
         st.info("No sales data yet. Start by adding your first sale!")
@@ -599,62 +814,23 @@ def render_dashboard(db_manager):
     with col1:
         period = st.selectbox("📅 Period", ["Today", "This Week", "This Month", "All Time"])
     
-    # Filter data based on period
+    # Filter data based on period (cached until the data or the period changes)
     today = datetime.now().date()
-    if 'Date' in df.columns:
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        
-        if period == "Today":
-            filtered_df = df[df['Date'].dt.date == today]
-        elif period == "This Week":
-            week_start = today - timedelta(days=today.weekday())
-            filtered_df = df[df['Date'].dt.date >= week_start]
-        elif period == "This Month":
-            filtered_df = df[(df['Date'].dt.month == today.month) & (df['Date'].dt.year == today.year)]
-        else:
-            filtered_df = df
-    else:
-        filtered_df = df
+    filtered_df = filter_by_period(db_manager, version, period, today)
     
     # Key metrics
     st.markdown("### 📊 Key Metrics")
     col1, col2, col3, col4 = st.columns(4)
     
-    with col1:
-        total_sales = filtered_df['Total Amount'].sum() if 'Total Amount' in filtered_df.columns else 0
-        st.markdown(f"""
-        <div class='metric-card'>
-            <h3>₹{total_sales:,.0f}</h3>
-            <p>Total Sales</p>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col2:
-        total_orders = len(filtered_df)
-        st.markdown(f"""
-        <div class='success-card'>
-            <h3>{total_orders}</h3>
-            <p>Total Orders</p>
-        </div>
-        """, unsafe_allow_html=True)
+    total_sales = filtered_df['Total Amount'].sum() if 'Total Amount' in filtered_df.columns else 0
+    total_orders = len(filtered_df)
+    total_quantity = filtered_df['Quantity'].sum() if 'Quantity' in filtered_df.columns else 0
+    pending = filtered_df['Balance'].sum() if 'Balance' in filtered_df.columns else 0
     
-    with col3:
-        total_quantity = filtered_df['Quantity'].sum() if 'Quantity' in filtered_df.columns else 0
-        st.markdown(f"""
-        <div class='info-card'>
-            <h3>{total_quantity:,.0f}</h3>
-            <p>Items Sold</p>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col4:
-        pending = filtered_df[filtered_df['Payment Status'] != 'Paid']['Balance'].sum() if 'Balance' in filtered_df.columns else 0
-        st.markdown(f"""
-        <div class='warning-card'>
-            <h3>₹{pending:,.0f}</h3>
-            <p>Pending Amount</p>
-        </div>
-        """, unsafe_allow_html=True)
+    col1.metric("Total Sales", f"₹{total_sales:,.0f}")
+    col2.metric("Total Orders", total_orders)
+    col3.metric("Items Sold", f"{total_quantity:,.0f}")
+    col4.metric("Pending Amount", f"₹{pending:,.0f}")
     
     st.markdown("---")
     
@@ -664,32 +840,34 @@ def render_dashboard(db_manager):
     with col1:
         st.markdown("### 🏘️ Sales by Village")
         if 'Village' in filtered_df.columns and 'Total Amount' in filtered_df.columns:
-            village_sales = filtered_df.groupby('Village')['Total Amount'].sum().reset_index()
+            village_sales = filtered_df.groupby('Village', observed=True, sort=False)['Total Amount'].sum().reset_index()
             if not village_sales.empty:
                 st.bar_chart(village_sales.set_index('Village'))
     
     with col2:
         st.markdown("### 🍵 Sales by Tea Type")
         if 'Tea Type' in filtered_df.columns and 'Total Amount' in filtered_df.columns:
-            tea_sales = filtered_df.groupby('Tea Type')['Total Amount'].sum().reset_index()
+            tea_sales = filtered_df.groupby('Tea Type', observed=True, sort=False)['Total Amount'].sum().reset_index()
             if not tea_sales.empty:
                 st.bar_chart(tea_sales.set_index('Tea Type'))
     
     # Recent sales
     st.markdown("### 🕐 Recent Sales")
     if not filtered_df.empty:
-        display_df = filtered_df.tail(10).iloc[::-1]
+        display_df = filtered_df.iloc[:10]  # sales are loaded newest first
         display_cols = ['Date', 'Customer Name', 'Village', 'Tea Type', 'Packaging', 'Quantity', 'Total Amount', 'Payment Status']
         available_cols = [col for col in display_cols if col in display_df.columns]
         st.dataframe(display_df[available_cols], use_container_width=True, hide_index=True)
 
 def render_new_sale(db_manager):
     """Render the new sale entry page"""
+    from streamlit_searchbox import st_searchbox
+    
     st.markdown("<div class='page-title'><h2>➕ New Sale Entry</h2></div>", unsafe_allow_html=True)
     
     # Load data
-    customers = load_customers_data(db_manager)
-    pricing = load_pricing_data(db_manager)
+    customers = load_customers_data(db_manager, get_data_version("customers"))
+    pricing = st.session_state['pricing']
     
     # Initialize session state for village
     if 'selected_village' not in st.session_state:
@@ -701,30 +879,32 @@ def render_new_sale(db_manager):
         selected_date = st.date_input("📅 Date", value=datetime.today(), key="sale_date")
     with col2:
         auto_day = get_day_from_date(selected_date)
-        selected_day = st.selectbox("📆 Day", options=DAYS_OF_WEEK, index=DAYS_OF_WEEK.index(auto_day), key="sale_day")
+        selected_day = st.selectbox("📆 Day", options=DAYS_OF_WEEK, index=DAY_INDEX[auto_day], key="sale_day")
     
     # Row 2: Village and Customer
     col3, col4 = st.columns(2)
     with col3:
         auto_village = DAY_TO_VILLAGE.get(selected_day, VILLAGES[0])
-        village_index = VILLAGES.index(auto_village) if auto_village in VILLAGES else 0
+        village_index = VILLAGE_INDEX.get(auto_village, 0)
         village = st.selectbox("🏘️ Village", options=VILLAGES, index=village_index, key="sale_village")
         st.session_state.selected_village = village
     
     with col4:
         # Customer searchbox with autocomplete
-        customer_list = customers.get(village, [])
+        customer_list = customers.get(village, ())
+        lowercase_names = lowercase_customers(village, customer_list)
+        known_names = customer_name_set(village, customer_list)
         
         def search_customer(search_term):
             """Search function for customer autocomplete"""
             if not search_term:
-                return customer_list[:15]  # Show first 15 customers
+                return list(customer_list[:15])  # Show first 15 customers
             
             search_lower = search_term.lower().strip()
-            matches = [c for c in customer_list if search_lower in c.lower()]
+            matches = [customer_list[i] for i, name in enumerate(lowercase_names) if search_lower in name]
             
             # If typed name not in list, include it as an option (will be saved automatically)
-            if search_term.strip() and search_term.strip() not in [c.strip() for c in customer_list]:
+            if search_term.strip() and search_term.strip() not in known_names:
                 matches.insert(0, search_term.strip())  # Add typed name at top
             
             return matches[:15] if matches else [search_term.strip()]
@@ -760,7 +940,7 @@ def render_new_sale(db_manager):
     with col5:
         tea_type = st.selectbox("🍵 Tea Type", options=TEA_TYPES, key="tea_type_select")
     with col6:
-        packaging = st.selectbox("📦 Packaging", options=list(pricing.keys()), key="packaging_select")
+        packaging = st.selectbox("📦 Packaging", options=st.session_state['packaging_keys'], key="packaging_select")
     
     # Display Rate and Total
     rate = pricing.get(packaging, 0)
@@ -793,13 +973,12 @@ def render_new_sale(db_manager):
                 st.error("⚠️ Please enter a customer name!")
             else:
                 # Check if this is a new customer and save automatically
-                customer_list = customers.get(village, [])
-                if final_customer not in [c.strip() for c in customer_list]:
+                if final_customer not in known_names:
                     # Save to MongoDB
                     add_customer(db_manager, village, final_customer)
                     # Also save to local JSON file
                     save_customer_to_json(village, final_customer)
-                    load_customers_data.clear()  # Clear cache to reload customers
+                    bump_data_version("customers")  # Reload customers on the next run
                 
                 # Save sale
                 sale_data = {
@@ -825,9 +1004,13 @@ def render_new_sale(db_manager):
 
 def render_view_sales(db_manager):
     """Render the view/edit/delete sales page"""
+    import numpy as np
+    import pandas as pd
+    
     st.markdown("<div class='page-title'><h2>📋 View & Manage Sales</h2></div>", unsafe_allow_html=True)
     
-    df = load_sales_data(db_manager)
+    version = get_data_version("sales")
+    df = load_sales_data(db_manager, version)
     
     if df.empty:
         st.info("No sales data available.")
@@ -846,21 +1029,19 @@ def render_view_sales(db_manager):
     with col4:
         payment_filter = st.selectbox("Payment Status", ["All"] + PAYMENT_OPTIONS)
     
-    # Apply filters
-    filtered_df = df.copy()
+    # Apply filters as one combined mask so the frame is only sliced once
+    mask = pd.Series(True, index=df.index)
     
-    if 'Date' in filtered_df.columns:
-        filtered_df['Date'] = pd.to_datetime(filtered_df['Date'], errors='coerce')
-        filtered_df = filtered_df[
-            (filtered_df['Date'].dt.date >= date_filter) & 
-            (filtered_df['Date'].dt.date <= date_filter_end)
-        ]
+    if 'Date' in df.columns:
+        mask &= (df['_date_day'] >= np.datetime64(date_filter)) & (df['_date_day'] <= np.datetime64(date_filter_end))
     
-    if village_filter != "All" and 'Village' in filtered_df.columns:
-        filtered_df = filtered_df[filtered_df['Village'] == village_filter]
+    if village_filter != "All" and 'Village' in df.columns:
+        mask &= df['Village'].eq(village_filter)
     
-    if payment_filter != "All" and 'Payment Status' in filtered_df.columns:
-        filtered_df = filtered_df[filtered_df['Payment Status'] == payment_filter]
+    if payment_filter != "All" and 'Payment Status' in df.columns:
+        mask &= df['Payment Status'].eq(payment_filter)
+    
+    filtered_df = df.loc[mask]
     
     # Summary
     st.markdown("---")
@@ -871,24 +1052,22 @@ def render_view_sales(db_manager):
         total = filtered_df['Total Amount'].sum() if 'Total Amount' in filtered_df.columns else 0
         st.metric("Total Amount", f"₹{total:,.0f}")
     with col3:
-        pending = filtered_df[filtered_df['Payment Status'] != 'Paid']['Balance'].sum() if 'Balance' in filtered_df.columns else 0
+        pending = filtered_df['Balance'].sum() if 'Balance' in filtered_df.columns else 0
         st.metric("Pending", f"₹{pending:,.0f}")
     
     # Export button
     st.markdown("---")
     col1, col2 = st.columns([3, 1])
-    with col2:
-        if not filtered_df.empty:
-            buffer = io.BytesIO()
-            with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-                filtered_df.to_excel(writer, index=False, sheet_name='Sales')
-            
-            st.download_button(
-                label="📥 Download Excel",
-                data=buffer.getvalue(),
-                file_name=f"sales_export_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+    if not filtered_df.empty:
+        with col2, st.expander("📥 Export"):
+            # Only build the workbook when asked for, not on every rerun
+            if st.button("📄 Prepare Excel", key="prepare_sales_excel"):
+                st.download_button(
+                    label="📥 Download Excel",
+                    data=to_excel_bytes(filtered_df, 'Sales'),
+                    file_name=f"sales_export_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
     
     # Display data
     st.markdown("### 📊 Sales Data")
@@ -900,7 +1079,12 @@ def render_view_sales(db_manager):
                        'Quantity', 'Total Amount', 'Payment Status', 'Balance']
         available_cols = [col for col in display_cols if col in filtered_df.columns]
         
-        st.dataframe(filtered_df[available_cols].iloc[::-1], use_container_width=True, hide_index=True)
+        # Only ship the most recent rows to the browser (sales are loaded newest first)
+        rows_to_show = st.number_input("Rows to show", min_value=50, max_value=5000, value=100, step=50)
+        column_positions = filtered_df.columns.get_indexer(available_cols)
+        st.dataframe(filtered_df.iloc[:rows_to_show, column_positions], use_container_width=True, hide_index=True)
+        if len(filtered_df) > rows_to_show:
+            st.caption(f"Showing {rows_to_show} of {len(filtered_df)} records")
         
         # Edit/Delete section
         st.markdown("---")
@@ -912,14 +1096,12 @@ def render_view_sales(db_manager):
             
             if selected_id:
                 selected_row = filtered_df[filtered_df['ID'] == selected_id].iloc[0]
-                # row_index is no longer needed with MongoDB migration as we use sale_id (ID)
                 
                 col1, col2 = st.columns(2)
                 
                 with col1:
                     if st.button("✏️ Edit Entry", use_container_width=True):
                         st.session_state['editing_id'] = selected_id
-                        st.session_state['editing_row'] = row_index
                 
                 with col2:
                     if st.button("🗑️ Delete Entry", use_container_width=True, type="secondary"):
@@ -931,26 +1113,29 @@ def render_view_sales(db_manager):
                 if st.session_state.get('editing_id') == selected_id:
                     st.markdown("#### Edit Entry")
                     
-                    pricing = load_pricing_data(db_manager)
+                    pricing = st.session_state['pricing']
                     
-                    # Initialize session state for edit values if not exists
-                    if f'edit_packaging_{selected_id}' not in st.session_state:
-                        st.session_state[f'edit_packaging_{selected_id}'] = selected_row.get('Packaging', list(pricing.keys())[0])
-                    if f'edit_quantity_{selected_id}' not in st.session_state:
-                        st.session_state[f'edit_quantity_{selected_id}'] = int(selected_row.get('Quantity', 1))
+                    # Starting values for this entry's edit inputs, kept in one dict per sale
+                    edit_buffer = st.session_state.setdefault('edit_buffer', {})
+                    if selected_id not in edit_buffer:
+                        edit_buffer[selected_id] = {
+                            'packaging': selected_row.get('Packaging', st.session_state['packaging_keys'][0]),
+                            'quantity': int(selected_row.get('Quantity', 1))
+                        }
+                    buf = edit_buffer[selected_id]
                     
                     # Inputs outside form for dynamic calculation
                     col1, col2 = st.columns(2)
                     with col1:
-                        edit_date = st.date_input("Date", value=pd.to_datetime(selected_row['Date']).date() if pd.notna(selected_row.get('Date')) else datetime.now().date(), key=f"edit_date_{selected_id}")
-                        edit_village = st.selectbox("Village", VILLAGES, index=VILLAGES.index(selected_row['Village']) if selected_row.get('Village') in VILLAGES else 0, key=f"edit_village_{selected_id}")
-                        edit_tea = st.selectbox("Tea Type", TEA_TYPES, index=TEA_TYPES.index(selected_row['Tea Type']) if selected_row.get('Tea Type') in TEA_TYPES else 0, key=f"edit_tea_{selected_id}")
-                        edit_packaging = st.selectbox("Packaging", list(pricing.keys()), index=list(pricing.keys()).index(st.session_state[f'edit_packaging_{selected_id}']) if st.session_state[f'edit_packaging_{selected_id}'] in pricing else 0, key=f"edit_packaging_{selected_id}")
+                        edit_date = st.date_input("Date", value=selected_row['Date'].date() if pd.notna(selected_row.get('Date')) else datetime.now().date(), key=f"edit_date_{selected_id}")
+                        edit_village = st.selectbox("Village", VILLAGES, index=VILLAGE_INDEX.get(selected_row.get('Village'), 0), key=f"edit_village_{selected_id}")
+                        edit_tea = st.selectbox("Tea Type", TEA_TYPES, index=TEA_TYPE_INDEX.get(selected_row.get('Tea Type'), 0), key=f"edit_tea_{selected_id}")
+                        edit_packaging = st.selectbox("Packaging", st.session_state['packaging_keys'], index=st.session_state['packaging_index'].get(buf['packaging'], 0), key=f"edit_packaging_{selected_id}")
                     
                     with col2:
                         edit_customer = st.text_input("Customer Name", value=selected_row.get('Customer Name', ''), key=f"edit_customer_{selected_id}")
-                        edit_quantity = st.number_input("Quantity", min_value=1, value=st.session_state[f'edit_quantity_{selected_id}'], key=f"edit_quantity_{selected_id}")
-                        edit_payment = st.selectbox("Payment Status", PAYMENT_OPTIONS, index=PAYMENT_OPTIONS.index(selected_row['Payment Status']) if selected_row.get('Payment Status') in PAYMENT_OPTIONS else 0, key=f"edit_payment_{selected_id}")
+                        edit_quantity = st.number_input("Quantity", min_value=1, value=buf['quantity'], key=f"edit_quantity_{selected_id}")
+                        edit_payment = st.selectbox("Payment Status", PAYMENT_OPTIONS, index=PAYMENT_INDEX.get(selected_row.get('Payment Status'), 0), key=f"edit_payment_{selected_id}")
                         edit_paid = st.number_input("Amount Paid", min_value=0.0, value=float(selected_row.get('Amount Paid', 0)), key=f"edit_paid_{selected_id}")
                     
                     # Calculate total dynamically
@@ -988,20 +1173,17 @@ def render_view_sales(db_manager):
                                 st.success("✅ Entry updated successfully!")
                                 # Clean up session state
                                 del st.session_state['editing_id']
-                                del st.session_state['editing_row']
-                                if f'edit_packaging_{selected_id}' in st.session_state:
-                                    del st.session_state[f'edit_packaging_{selected_id}']
-                                if f'edit_quantity_{selected_id}' in st.session_state:
-                                    del st.session_state[f'edit_quantity_{selected_id}']
+                                edit_buffer.pop(selected_id, None)
                                 st.rerun()
 
 def render_reports(db_manager):
     """Render the reports page"""
     st.markdown("<div class='page-title'><h2>📊 Reports & Analytics</h2></div>", unsafe_allow_html=True)
     
-    df = load_sales_data(db_manager)
+    version = get_data_version("sales")
     
-    if df.empty:
+    # Daily and village reports are grouped in MongoDB; only the others load every sale
+    if not sales_count(db_manager, version):
         st.info("No data available for reports.")
         return
     
@@ -1017,18 +1199,10 @@ def render_reports(db_manager):
     
     st.markdown("---")
     
-    if 'Date' in df.columns:
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-    
     if report_type == "📅 Daily Summary":
         st.markdown("### Daily Sales Summary")
-        if 'Date' in df.columns:
-            daily = df.groupby(df['Date'].dt.date).agg({
-                'Total Amount': 'sum',
-                'Quantity': 'sum',
-                'ID': 'count'
-            }).rename(columns={'ID': 'Orders'}).reset_index()
-            daily = daily.sort_values('Date', ascending=False)
+        daily = daily_sales_summary(db_manager, version)
+        if not daily.empty:
             st.dataframe(daily, use_container_width=True, hide_index=True)
             
             st.markdown("### 📈 Daily Trend")
@@ -1036,25 +1210,15 @@ def render_reports(db_manager):
     
     elif report_type == "📆 Weekly Summary":
         st.markdown("### Weekly Sales Summary")
-        if 'Date' in df.columns:
-            df['Week'] = df['Date'].dt.isocalendar().week
-            df['Year'] = df['Date'].dt.year
-            weekly = df.groupby(['Year', 'Week']).agg({
-                'Total Amount': 'sum',
-                'Quantity': 'sum',
-                'ID': 'count'
-            }).rename(columns={'ID': 'Orders'}).reset_index()
-            st.dataframe(weekly, use_container_width=True, hide_index=True)
+        reports = all_report_aggregates(db_manager, version)
+        if 'weekly' in reports:
+            st.dataframe(reports['weekly'], use_container_width=True, hide_index=True)
     
     elif report_type == "🗓️ Monthly Summary":
         st.markdown("### Monthly Sales Summary")
-        if 'Date' in df.columns:
-            df['Month'] = df['Date'].dt.to_period('M').astype(str)
-            monthly = df.groupby('Month').agg({
-                'Total Amount': 'sum',
-                'Quantity': 'sum',
-                'ID': 'count'
-            }).rename(columns={'ID': 'Orders'}).reset_index()
+        reports = all_report_aggregates(db_manager, version)
+        if 'monthly' in reports:
+            monthly = reports['monthly']
             st.dataframe(monthly, use_container_width=True, hide_index=True)
             
             st.markdown("### 📈 Monthly Trend")
@@ -1062,25 +1226,14 @@ def render_reports(db_manager):
     
     elif report_type == "👤 Customer-wise Report":
         st.markdown("### Customer-wise Sales Summary")
-        if 'Customer Name' in df.columns:
-            customer_report = df.groupby('Customer Name').agg({
-                'Total Amount': 'sum',
-                'Quantity': 'sum',
-                'ID': 'count',
-                'Balance': 'sum'
-            }).rename(columns={'ID': 'Orders'}).reset_index()
-            customer_report = customer_report.sort_values('Total Amount', ascending=False)
-            st.dataframe(customer_report, use_container_width=True, hide_index=True)
+        reports = all_report_aggregates(db_manager, version)
+        if 'customer' in reports:
+            st.dataframe(reports['customer'], use_container_width=True, hide_index=True)
     
     elif report_type == "🏘️ Village-wise Report":
         st.markdown("### Village-wise Sales Summary")
-        if 'Village' in df.columns:
-            village_report = df.groupby('Village').agg({
-                'Total Amount': 'sum',
-                'Quantity': 'sum',
-                'ID': 'count',
-                'Balance': 'sum'
-            }).rename(columns={'ID': 'Orders'}).reset_index()
+        village_report = village_sales_summary(db_manager, version)
+        if not village_report.empty:
             st.dataframe(village_report, use_container_width=True, hide_index=True)
             
             st.markdown("### 📊 Village Comparison")
@@ -1088,38 +1241,25 @@ def render_reports(db_manager):
     
     elif report_type == "📦 Product-wise Report":
         st.markdown("### Product-wise Sales Summary")
+        reports = all_report_aggregates(db_manager, version)
         col1, col2 = st.columns(2)
         
         with col1:
             st.markdown("#### By Tea Type")
-            if 'Tea Type' in df.columns:
-                tea_report = df.groupby('Tea Type').agg({
-                    'Total Amount': 'sum',
-                    'Quantity': 'sum'
-                }).reset_index()
-                st.dataframe(tea_report, use_container_width=True, hide_index=True)
+            if 'tea' in reports:
+                st.dataframe(reports['tea'], use_container_width=True, hide_index=True)
         
         with col2:
             st.markdown("#### By Packaging")
-            if 'Packaging' in df.columns:
-                pack_report = df.groupby('Packaging').agg({
-                    'Total Amount': 'sum',
-                    'Quantity': 'sum'
-                }).reset_index()
-                st.dataframe(pack_report, use_container_width=True, hide_index=True)
+            if 'packaging' in reports:
+                st.dataframe(reports['packaging'], use_container_width=True, hide_index=True)
 
 def render_pending_payments(db_manager):
     """Render the pending payments page"""
     st.markdown("<div class='page-title'><h2>💰 Pending Payments</h2></div>", unsafe_allow_html=True)
     
-    df = load_sales_data(db_manager)
-    
-    if df.empty:
-        st.info("No sales data available.")
-        return
-    
-    # Filter unpaid/half-paid
-    pending_df = df[df['Payment Status'].isin(['Not paid', 'Half paid'])].copy() if 'Payment Status' in df.columns else pd.DataFrame()
+    # Only unpaid/half-paid sales are fetched
+    pending_df = pending_frame(db_manager, get_data_version("sales"))
     
     if pending_df.empty:
         st.success("🎉 No pending payments! All dues are cleared.")
@@ -1128,32 +1268,13 @@ def render_pending_payments(db_manager):
     # Summary cards
     col1, col2, col3 = st.columns(3)
     
-    with col1:
-        total_pending = pending_df['Balance'].sum() if 'Balance' in pending_df.columns else 0
-        st.markdown(f"""
-        <div class='warning-card'>
-            <h3>₹{total_pending:,.0f}</h3>
-            <p>Total Pending</p>
-        </div>
-        """, unsafe_allow_html=True)
+    total_pending = pending_df['Balance'].sum() if 'Balance' in pending_df.columns else 0
+    not_paid = pending_df[pending_df['Payment Status'] == 'Not paid']['Balance'].sum() if 'Balance' in pending_df.columns else 0
+    half_paid = pending_df[pending_df['Payment Status'] == 'Half paid']['Balance'].sum() if 'Balance' in pending_df.columns else 0
     
-    with col2:
-        not_paid = pending_df[pending_df['Payment Status'] == 'Not paid']['Balance'].sum() if 'Balance' in pending_df.columns else 0
-        st.markdown(f"""
-        <div class='metric-card'>
-            <h3>₹{not_paid:,.0f}</h3>
-            <p>Not Paid</p>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col3:
-        half_paid = pending_df[pending_df['Payment Status'] == 'Half paid']['Balance'].sum() if 'Balance' in pending_df.columns else 0
-        st.markdown(f"""
-        <div class='info-card'>
-            <h3>₹{half_paid:,.0f}</h3>
-            <p>Half Paid</p>
-        </div>
-        """, unsafe_allow_html=True)
+    col1.metric("Total Pending", f"₹{total_pending:,.0f}")
+    col2.metric("Not Paid", f"₹{not_paid:,.0f}")
+    col3.metric("Half Paid", f"₹{half_paid:,.0f}")
     
     st.markdown("---")
     
@@ -1166,7 +1287,7 @@ def render_pending_payments(db_manager):
     # Customer-wise pending
     st.markdown("### 👤 Customer-wise Pending")
     if 'Customer Name' in pending_df.columns and 'Balance' in pending_df.columns:
-        customer_pending = pending_df.groupby(['Village', 'Customer Name']).agg({
+        customer_pending = pending_df.groupby(['Village', 'Customer Name'], observed=True, sort=False).agg({
             'Balance': 'sum',
             'ID': 'count'
         }).rename(columns={'ID': 'Entries'}).reset_index()
@@ -1178,47 +1299,75 @@ def render_pending_payments(db_manager):
     st.markdown("### 📋 Detailed Pending Entries")
     display_cols = ['Date', 'Customer Name', 'Village', 'Total Amount', 'Amount Paid', 'Balance', 'Payment Status']
     available_cols = [col for col in display_cols if col in pending_df.columns]
-    st.dataframe(pending_df[available_cols].iloc[::-1], use_container_width=True, hide_index=True)
+    st.dataframe(pending_df[available_cols], use_container_width=True, hide_index=True)
     
-    # Export
+    # Record a payment without opening the full edit form
     if not pending_df.empty:
-        buffer = io.BytesIO()
-        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-            pending_df.to_excel(writer, index=False, sheet_name='Pending')
-        
-        st.download_button(
-            label="📥 Download Pending Report",
-            data=buffer.getvalue(),
-            file_name=f"pending_payments_{datetime.now().strftime('%Y%m%d')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+        with st.expander("💵 Record Payment"):
+            labels = dict(zip(
+                pending_df['ID'],
+                pending_df['Date'].dt.strftime('%d %b %Y').fillna('') + " · "
+                + pending_df['Customer Name'].astype(str) + " (" + pending_df['Village'].astype(str) + ") · ₹"
+                + pending_df['Balance'].map('{:,.0f}'.format) + " due"
+            ))
+            payment_id = st.selectbox("Entry", options=list(labels), format_func=labels.get, key="payment_entry")
+            balance_due = float(pending_df.loc[pending_df['ID'] == payment_id, 'Balance'].iloc[0])
+            payment_amount = st.number_input(
+                "Amount received (₹)", min_value=1.0, max_value=max(balance_due, 1.0),
+                value=max(balance_due, 1.0), step=10.0, key=f"payment_amount_{payment_id}"
+            )
+            if st.button("💾 Record Payment", key="record_payment"):
+                if record_payment(db_manager, payment_id, payment_amount):
+                    st.success("✅ Payment recorded!")
+                    st.rerun()
+    
+    # Export (the workbook is only built when asked for)
+    if not pending_df.empty:
+        with st.expander("📥 Export"):
+            if st.button("📄 Prepare Pending Report", key="prepare_pending_excel"):
+                st.download_button(
+                    label="📥 Download Pending Report",
+                    data=to_excel_bytes(pending_df, 'Pending'),
+                    file_name=f"pending_payments_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
 
 def render_settings(db_manager):
     """Render the settings page"""
+    import pandas as pd
+    
     st.markdown("<div class='page-title'><h2>⚙️ Settings</h2></div>", unsafe_allow_html=True)
     
     tab1, tab2, tab3 = st.tabs(["💰 Pricing", "👥 Customers", "🏘️ Villages"])
     
     with tab1:
         st.markdown("### Update Package Prices")
-        pricing = load_pricing_data(db_manager)
+        pricing = st.session_state['pricing']
         
-        for package, rate in pricing.items():
-            col1, col2, col3 = st.columns([2, 2, 1])
-            with col1:
-                st.text(f"📦 {package}")
-            with col2:
-                new_rate = st.number_input(f"Rate for {package}", value=rate, min_value=1, key=f"price_{package}", label_visibility="collapsed")
-            with col3:
-                if new_rate != rate:
-                    if st.button("💾", key=f"save_{package}"):
-                        if update_pricing(db_manager, package, new_rate):
-                            st.success(f"✅ {package} price updated!")
-                            st.rerun()
+        # One editable table instead of an input + button row per package
+        edited = st.data_editor(
+            pd.DataFrame(list(pricing.items()), columns=["Package", "Rate"]),
+            num_rows="fixed",
+            disabled=["Package"],
+            column_config={"Rate": st.column_config.NumberColumn("Rate (₹)", min_value=1, step=1)},
+            hide_index=True,
+            use_container_width=True,
+            key="pricing_editor"
+        )
+        changes = {
+            package: int(rate)
+            for package, rate in edited.itertuples(index=False)
+            if pd.notna(rate) and rate != pricing[package]
+        }
+        if changes and st.button("💾 Save all", key="save_pricing"):
+            updated = [package for package, rate in changes.items() if update_pricing(db_manager, package, rate)]
+            if updated:
+                st.success(f"✅ Updated prices for {', '.join(updated)}")
+                st.rerun()
     
     with tab2:
         st.markdown("### Manage Customers")
-        customers = load_customers_data(db_manager)
+        customers = load_customers_data(db_manager, get_data_version("customers"))
         
         # Add customer
         st.markdown("#### ➕ Add New Customer")
@@ -1241,39 +1390,39 @@ def render_settings(db_manager):
         st.markdown("#### 📋 Manage Customers")
         view_village = st.selectbox("Select Village", VILLAGES, key="view_cust_village")
         
-        village_customers = customers.get(view_village, [])
+        village_customers = customers.get(view_village, ())
         if village_customers:
-            for customer in village_customers:
-                col1, col2, col3 = st.columns([3, 1, 1])
-                with col1:
-                    st.text(f"👤 {customer}")
-                with col2:
-                    if st.button("✏️", key=f"edit_{view_village}_{customer}", help="Edit customer name"):
-                        st.session_state[f'editing_{view_village}_{customer}'] = True
-                with col3:
-                    if st.button("🗑️", key=f"del_{view_village}_{customer}", help="Delete customer"):
-                        if delete_customer(db_manager, view_village, customer):
-                            st.success(f"✅ Deleted {customer}")
-                            st.rerun()
-                
-                # Show edit form if editing
-                if st.session_state.get(f'editing_{view_village}_{customer}', False):
-                    with st.form(key=f"edit_form_{view_village}_{customer}"):
-                        new_name = st.text_input("New customer name", value=customer, key=f"new_name_{view_village}_{customer}")
-                        col_a, col_b = st.columns(2)
-                        with col_a:
-                            if st.form_submit_button("💾 Save"):
-                                if new_name.strip() and new_name.strip() != customer:
-                                    if edit_customer(db_manager, view_village, customer, new_name.strip()):
-                                        st.success(f"✅ Updated to {new_name.strip()}")
-                                        st.session_state[f'editing_{view_village}_{customer}'] = False
-                                        st.rerun()
-                                else:
-                                    st.warning("⚠️ Please enter a different name")
-                        with col_b:
-                            if st.form_submit_button("❌ Cancel"):
-                                st.session_state[f'editing_{view_village}_{customer}'] = False
+            # One table widget for the whole village; actions apply to the selected row
+            event = st.dataframe(
+                pd.DataFrame(village_customers, columns=["Customer"]),
+                use_container_width=True,
+                hide_index=True,
+                on_select="rerun",
+                selection_mode="single-row",
+                # The version in the key clears the selection after every customer write,
+                # so a stale row index can never point at a different customer
+                key=f"customer_table_{view_village}_{get_data_version('customers')}"
+            )
+            selected_rows = [row for row in event.selection.rows if row < len(village_customers)]
+            
+            if selected_rows:
+                customer = village_customers[selected_rows[0]]
+                st.markdown(f"**👤 {customer}**")
+                with st.form(key=f"edit_form_{view_village}_{customer}"):
+                    new_name = st.text_input("New customer name", value=customer, key=f"new_name_{view_village}_{customer}")
+                    if st.form_submit_button("💾 Save"):
+                        if new_name.strip() and new_name.strip() != customer:
+                            if edit_customer(db_manager, view_village, customer, new_name.strip()):
+                                st.success(f"✅ Updated to {new_name.strip()}")
                                 st.rerun()
+                        else:
+                            st.warning("⚠️ Please enter a different name")
+                if st.button("🗑️ Delete customer", key=f"del_{view_village}_{customer}"):
+                    if delete_customer(db_manager, view_village, customer):
+                        st.success(f"✅ Deleted {customer}")
+                        st.rerun()
+            else:
+                st.caption("Select a customer to edit or delete.")
         else:
             st.info("No customers in this village.")
     
@@ -1318,6 +1467,14 @@ def main():
         st.error("❌ Not connected to MongoDB. Please check your connection settings.")
         st.stop()
     
+    # Load sales, customers and pricing in parallel on the first run after login
+    if not st.session_state.get('_prefetched'):
+        prefetch(db_manager)
+        st.session_state['_prefetched'] = True
+    
+    # Pages read pricing from session state; reload it only when it has changed
+    sync_session_pricing(db_manager)
+    
     # Render sidebar and get selected page
     page = render_sidebar()
     
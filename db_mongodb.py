@@ -4,11 +4,13 @@ Handles all database operations with MongoDB Atlas
 """
 
 import os
-from datetime import datetime
-from typing import Dict, List, Optional, Any
-import streamlit as st
-from pymongo import MongoClient, ASCENDING, DESCENDING
-from pymongo.errors import ConnectionFailure, DuplicateKeyError, PyMongoError
+import logging
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, List, Optional, Any, Tuple
+from bson import ObjectId
+from pymongo import MongoClient, ASCENDING, DESCENDING, IndexModel, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, OperationFailure, PyMongoError
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -18,11 +20,35 @@ load_dotenv()
 MONGODB_URI = os.getenv("MONGODB_URI")
 DB_NAME = os.getenv("DB_NAME", "teasale")
 
+logger = logging.getLogger(__name__)
+
 # Collection names
 SALES_COLLECTION = "sales"
 CUSTOMERS_COLLECTION = "customers"
 PRICING_COLLECTION = "pricing"
 
+# Bookkeeping fields the app never shows; leaving them on the server keeps sales reads small.
+# Sales are identified by _id; sale_id only exists on records written by older versions.
+DEFAULT_SALES_PROJECTION = {"sale_id": 0, "created_at": 0, "updated_at": 0}
+
+# (database, collection) pairs whose indexes this process has already ensured
+_INDEXES_DONE = set()
+
+# Server-side limit for aggregations, which scan a whole collection before
+# returning their first batch (a client socket timeout would cut them off)
+AGGREGATE_MAX_TIME_MS = 30_000
+
+# Payment statuses that still leave a balance owing
+PENDING_STATUSES = ["Not paid", "Half paid"]
+
+
+class TeaDBError(Exception):
+    """A database operation failed; the message is fit to show to the user"""
+
+
+class DuplicateCustomerError(TeaDBError):
+    """The customer already exists in that village"""
+
 
 class MongoDBManager:
     """MongoDB connection and operations manager"""
@@ -38,52 +64,94 @@ class MongoDBManager:
             if not MONGODB_URI:
                 raise ValueError("MONGODB_URI not found in environment variables")
             
+            # One client is shared by every session (see get_mongodb_client);
+            # keep a few connections warm so first queries skip the TLS handshake
             self.client = MongoClient(
                 MONGODB_URI,
-                serverSelectionTimeoutMS=5000,
+                # Fail fast: an unreachable cluster surfaces in ~2s instead of 5s
+                serverSelectionTimeoutMS=2000,
                 connectTimeoutMS=10000,
-                retryWrites=True
+                retryWrites=True,
+                maxPoolSize=50,
+                minPoolSize=5,
+                maxIdleTimeMS=300_000,
+                waitQueueTimeoutMS=2000,
+                appName="tea_powder",
+                # Sales documents are mostly repeated strings and compress well;
+                # the server picks the first of these it also supports
+                compressors="zstd,zlib",
+                zlibCompressionLevel=6
             )
             
             # Test connection
-            self.client.admin.command('ping')
+            self.client.admin.command('hello')
             self.db = self.client[DB_NAME]
             
-            # Create indexes
-            self._create_indexes()
-            
-        except ConnectionFailure as e:
-            st.error(f"❌ Failed to connect to MongoDB: {str(e)}")
+        except ConnectionFailure:
+            logger.exception("Failed to connect to MongoDB")
             raise
-        except Exception as e:
-            st.error(f"❌ MongoDB initialization error: {str(e)}")
+        except Exception:
+            logger.exception("MongoDB initialization error")
             raise
     
-    def _create_indexes(self):
-        """Create database indexes for optimized queries"""
+    def ensure_indexes(self):
+        """Create database indexes for optimized queries (at most once per process)"""
+        
+        def create(collection, models):
+            # One createIndexes command per collection; skipped once it has succeeded
+            key = (DB_NAME, collection.name)
+            if key in _INDEXES_DONE:
+                return
+            try:
+                collection.create_indexes(models)
+            except OperationFailure:
+                # The batch fails as a whole on one conflicting spec (e.g. an existing
+                # index with different options), so create the rest one by one
+                for model in models:
+                    options = dict(model.document)
+                    keys = list(options.pop("key").items())
+                    try:
+                        collection.create_index(keys, **options)
+                    except OperationFailure as e:
+                        logger.warning("Could not create index %s on %s: %s", options["name"], collection.name, e)
+            _INDEXES_DONE.add(key)
+        
         try:
-            # Sales collection indexes
-            self.db[SALES_COLLECTION].create_index("sale_id", unique=True)
-            self.db[SALES_COLLECTION].create_index([("date", DESCENDING)])
-            self.db[SALES_COLLECTION].create_index("village")
-            self.db[SALES_COLLECTION].create_index("customer_name")
-            
-            # Customers collection indexes
-            self.db[CUSTOMERS_COLLECTION].create_index(
-                [("village", ASCENDING), ("customer_name", ASCENDING)],
-                unique=True
-            )
+            sales = self.db[SALES_COLLECTION]
+            if (DB_NAME, SALES_COLLECTION) not in _INDEXES_DONE:
+                # Single-field indexes superseded by the compound ones below,
+                # and the legacy sale_id index now that sales are keyed by _id
+                existing = sales.index_information()
+                for name in ("sale_id_1", "village_1", "customer_name_1"):
+                    if name in existing:
+                        sales.drop_index(name)
+            
+            create(sales, [
+                IndexModel([("date", DESCENDING)], background=True),
+                # Village/customer history, newest first (equality, equality, sort)
+                IndexModel([("village", ASCENDING), ("customer_name", ASCENDING), ("date", DESCENDING)], background=True),
+                # Pending payments: equality on status, sorted by date
+                IndexModel([("payment_status", ASCENDING), ("date", DESCENDING)], background=True),
+            ])
             
-            # Pricing collection indexes
-            self.db[PRICING_COLLECTION].create_index("package", unique=True)
+            create(self.db[CUSTOMERS_COLLECTION], [
+                IndexModel([("village", ASCENDING), ("customer_name", ASCENDING)], unique=True, background=True),
+            ])
+            
+            create(self.db[PRICING_COLLECTION], [
+                IndexModel([("package", ASCENDING)], unique=True, background=True),
+            ])
             
         except Exception as e:
-            st.warning(f"⚠️ Could not create indexes: {str(e)}")
+            logger.warning("Could not create indexes: %s", e)
     
     def test_connection(self) -> bool:
         """Test if MongoDB connection is active"""
         try:
-            self.client.admin.command('ping')
+            # The background monitor already knows a reachable server: no round trip needed
+            if self.client.topology_description.has_known_servers:
+                return True
+            self.client.admin.command('hello')
             return True
         except Exception:
             return False
@@ -92,28 +160,54 @@ class MongoDBManager:
     # SALES OPERATIONS
     # ============================================
     
-    def get_all_sales(self) -> List[Dict]:
-        """Retrieve all sales records"""
+    def get_all_sales(self, limit: Optional[int] = None, projection: Optional[Dict[str, int]] = None) -> List[Dict]:
+        """Retrieve sales records, newest first (all of them unless a limit is given)"""
         try:
-            sales = list(self.db[SALES_COLLECTION].find().sort("date", DESCENDING))
+            if projection is None:
+                projection = DEFAULT_SALES_PROJECTION
+            cursor = self.db[SALES_COLLECTION].find({}, projection).sort("date", DESCENDING).batch_size(500)
+            if limit:
+                cursor = cursor.limit(limit)
+            sales = list(cursor)
             return sales
         except Exception as e:
-            st.error(f"Error fetching sales: {str(e)}")
-            return []
+            logger.exception("Error fetching sales")
+            raise TeaDBError(f"Error fetching sales: {e}") from e
+    
+    def count_sales(self) -> int:
+        """Number of sales records, read from collection metadata without scanning documents"""
+        try:
+            return self.db[SALES_COLLECTION].estimated_document_count()
+        except Exception as e:
+            logger.exception("Error counting sales")
+            raise TeaDBError(f"Error counting sales: {e}") from e
+    
+    def get_pending_sales(self, projection: Optional[Dict[str, int]] = None) -> List[Dict]:
+        """Retrieve sales that are not fully paid, newest first"""
+        try:
+            if projection is None:
+                projection = DEFAULT_SALES_PROJECTION
+            # Equality on status then sort on date: served by the (payment_status, date) index
+            cursor = self.db[SALES_COLLECTION].find(
+                {"payment_status": {"$in": PENDING_STATUSES}}, projection
+            ).sort("date", DESCENDING)
+            return list(cursor)
+        except Exception as e:
+            logger.exception("Error fetching pending sales")
+            raise TeaDBError(f"Error fetching pending sales: {e}") from e
     
     def add_sale(self, sale_data: Dict) -> bool:
         """Add a new sale record"""
         try:
-            # Generate unique sale ID
-            sale_id = datetime.now().strftime("%Y%m%d%H%M%S%f")
+            now = datetime.now(timezone.utc)
             
             # Calculate balance
             total = sale_data.get('total_amount', 0)
             paid = sale_data.get('amount_paid', 0)
             balance = total - paid if sale_data.get('payment_status') != 'Paid' else 0
             
+            # No custom id: the ObjectId _id is the sale's identifier
             document = {
-                "sale_id": sale_id,
                 "date": sale_data.get('date'),
                 "day": sale_data.get('day'),
                 "village": sale_data.get('village'),
@@ -127,19 +221,19 @@ class MongoDBManager:
                 "payment_status": sale_data.get('payment_status'),
                 "amount_paid": paid,
                 "balance": balance,
-                "created_at": datetime.now(),
-                "updated_at": datetime.now()
+                "created_at": now,
+                "updated_at": now
             }
             
             self.db[SALES_COLLECTION].insert_one(document)
             return True
             
         except Exception as e:
-            st.error(f"Error adding sale: {str(e)}")
-            return False
+            logger.exception("Error adding sale")
+            raise TeaDBError(f"Error adding sale: {e}") from e
     
     def update_sale(self, sale_id: str, updated_data: Dict) -> bool:
-        """Update an existing sale record"""
+        """Update an existing sale record (sale_id is the string form of its _id)"""
         try:
             # Calculate balance
             total = updated_data.get('total_amount', 0)
@@ -161,29 +255,108 @@ class MongoDBManager:
                     "payment_status": updated_data.get('payment_status'),
                     "amount_paid": paid,
                     "balance": balance,
-                    "updated_at": datetime.now()
+                    "updated_at": datetime.now(timezone.utc)
                 }
             }
             
             result = self.db[SALES_COLLECTION].update_one(
-                {"sale_id": sale_id},
+                {"_id": ObjectId(sale_id)},
                 update_doc
             )
             
             return result.modified_count > 0
             
         except Exception as e:
-            st.error(f"Error updating sale: {str(e)}")
-            return False
+            logger.exception("Error updating sale")
+            raise TeaDBError(f"Error updating sale: {e}") from e
+    
+    def record_payment(self, sale_id: str, paid_delta: float) -> bool:
+        """Add a payment to a sale; paid amount, balance and status are recomputed on the server"""
+        try:
+            paid = {"$add": [{"$ifNull": ["$amount_paid", 0]}, paid_delta]}
+            settled = {"$gte": [paid, "$total_amount"]}
+            
+            # A pipeline update reads the stored values atomically, so concurrent
+            # payments cannot overwrite each other the way a read-modify-write can
+            result = self.db[SALES_COLLECTION].update_one(
+                {"_id": ObjectId(sale_id)},
+                [{"$set": {
+                    "amount_paid": paid,
+                    "balance": {"$cond": [settled, 0, {"$subtract": ["$total_amount", paid]}]},
+                    "payment_status": {"$cond": [
+                        settled, "Paid", {"$cond": [{"$gt": [paid, 0]}, "Half paid", "Not paid"]}
+                    ]},
+                    "updated_at": "$$NOW"
+                }}]
+            )
+            
+            return result.modified_count > 0
+            
+        except Exception as e:
+            logger.exception("Error recording payment")
+            raise TeaDBError(f"Error recording payment: {e}") from e
     
     def delete_sale(self, sale_id: str) -> bool:
-        """Delete a sale record"""
+        """Delete a sale record (sale_id is the string form of its _id)"""
         try:
-            result = self.db[SALES_COLLECTION].delete_one({"sale_id": sale_id})
+            result = self.db[SALES_COLLECTION].delete_one({"_id": ObjectId(sale_id)})
             return result.deleted_count > 0
         except Exception as e:
-            st.error(f"Error deleting sale: {str(e)}")
-            return False
+            logger.exception("Error deleting sale")
+            raise TeaDBError(f"Error deleting sale: {e}") from e
+    
+    def aggregate_sales(self, by: Tuple[str, ...], metrics: Tuple[str, ...] = ("total_amount", "quantity")) -> List[Dict]:
+        """Group sales on the server; returns one row per group, ordered by the group fields,
+        with summed metrics and an order count"""
+        try:
+            group = {"_id": {field: f"${field}" for field in by}, "orders": {"$sum": 1}}
+            for metric in metrics:
+                group[metric] = {"$sum": f"${metric}"}
+            # $group output order is undefined; sort so tables and charts are stable
+            sort = {f"_id.{field}": ASCENDING for field in by}
+            
+            rows = []
+            for doc in self.db[SALES_COLLECTION].aggregate([{"$group": group}, {"$sort": sort}], maxTimeMS=AGGREGATE_MAX_TIME_MS):
+                row = doc.pop("_id")
+                row.update(doc)
+                rows.append(row)
+            return rows
+            
+        except Exception as e:
+            logger.exception("Error aggregating sales")
+            raise TeaDBError(f"Error aggregating sales: {e}") from e
+    
+    def get_sales_summary(self, start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, float]:
+        """Total, paid, balance and count of sales between two 'YYYY-MM-DD' dates (inclusive, open-ended if omitted)"""
+        summary = {"total": 0, "paid": 0, "balance": 0, "count": 0}
+        try:
+            date_range = {}
+            if start:
+                date_range["$gte"] = str(start)
+            if end:
+                date_range["$lte"] = str(end)
+            
+            pipeline = [{"$match": {"date": date_range}}] if date_range else []
+            pipeline.append({"$group": {
+                "_id": None,
+                "total": {"$sum": "$total_amount"},
+                "paid": {"$sum": "$amount_paid"},
+                "balance": {"$sum": "$balance"},
+                "count": {"$sum": 1}
+            }})
+            
+            for doc in self.db[SALES_COLLECTION].aggregate(pipeline, maxTimeMS=AGGREGATE_MAX_TIME_MS):
+                doc.pop("_id")
+                summary.update(doc)
+            return summary
+            
+        except Exception as e:
+            logger.exception("Error summarising sales")
+            raise TeaDBError(f"Error summarising sales: {e}") from e
+    
+    def get_sales_by_village(self) -> List[Dict]:
+        """Per-village totals, quantity, balance and order count"""
+        return self.aggregate_sales(("village",), ("total_amount", "quantity", "balance"))
     
     # ============================================
     # CUSTOMER OPERATIONS
@@ -192,70 +365,104 @@ class MongoDBManager:
     def get_all_customers(self) -> Dict[str, List[str]]:
         """Retrieve all customers grouped by village"""
         try:
-            customers_dict = {}
-            customers = self.db[CUSTOMERS_COLLECTION].find().sort("village", ASCENDING)
-            
-            for customer in customers:
-                village = customer.get('village')
-                name = customer.get('customer_name')
-                
-                if village not in customers_dict:
-                    customers_dict[village] = []
-                
-                if name and name not in customers_dict[village]:
-                    customers_dict[village].append(name)
+            # Group on the server so only one small document per village comes back;
+            # the sort is served by the (village, customer_name) index
+            pipeline = [
+                {"$sort": {"village": ASCENDING, "customer_name": ASCENDING}},
+                {"$group": {"_id": "$village", "names": {"$addToSet": "$customer_name"}}}
+            ]
+            cursor = self.db[CUSTOMERS_COLLECTION].aggregate(pipeline, allowDiskUse=False, maxTimeMS=AGGREGATE_MAX_TIME_MS)
             
-            return customers_dict
+            return {doc["_id"]: sorted(name for name in doc["names"] if name) for doc in cursor}
             
         except Exception as e:
-            st.error(f"Error fetching customers: {str(e)}")
-            return {}
+            logger.exception("Error fetching customers")
+            raise TeaDBError(f"Error fetching customers: {e}") from e
     
     def add_customer(self, village: str, customer_name: str) -> bool:
         """Add a new customer"""
+        name = customer_name.strip()
+        if not name:
+            return False
+        
         try:
             document = {
                 "village": village,
-                "customer_name": customer_name.strip(),
-                "added_on": datetime.now()
+                "customer_name": name,
+                "added_on": datetime.now(timezone.utc)
             }
             
             self.db[CUSTOMERS_COLLECTION].insert_one(document)
             return True
             
-        except DuplicateKeyError:
-            st.warning(f"Customer '{customer_name}' already exists in {village}")
-            return False
+        except DuplicateKeyError as e:
+            raise DuplicateCustomerError(f"Customer '{name}' already exists in {village}") from e
         except Exception as e:
-            st.error(f"Error adding customer: {str(e)}")
-            return False
+            logger.exception("Error adding customer")
+            raise TeaDBError(f"Error adding customer: {e}") from e
+    
+    def bulk_add_customers(self, pairs: List[Tuple[str, str]]) -> Tuple[int, int]:
+        """Insert many (village, customer_name) pairs in one round trip; returns (inserted, duplicates)"""
+        now = datetime.now(timezone.utc)
+        stripped = ((village, name.strip()) for village, name in pairs)
+        ops = [
+            InsertOne({"village": village, "customer_name": name, "added_on": now})
+            for village, name in stripped
+            if name
+        ]
+        if not ops:
+            return 0, 0
+        
+        try:
+            result = self.db[CUSTOMERS_COLLECTION].bulk_write(ops, ordered=False)
+            return result.inserted_count, 0
+            
+        except BulkWriteError as e:
+            # Unordered: every op is attempted, duplicates are reported per document
+            errors = e.details.get("writeErrors", [])
+            duplicates = sum(1 for error in errors if error.get("code") == 11000)
+            if duplicates < len(errors):
+                logger.error("Error adding customers: %d failed", len(errors) - duplicates)
+            return e.details.get("nInserted", 0), duplicates
+        except Exception as e:
+            logger.exception("Error adding customers")
+            raise TeaDBError(f"Error adding customers: {e}") from e
     
-    def update_customer(self, village: str, old_name: str, new_name: str) -> bool:
-        """Update a customer's name"""
+    def update_customer(self, village: str, old_name: str, new_name: str) -> Optional[Dict]:
+        """Rename a customer; returns the updated document, or None if the old name was not found"""
+        name = new_name.strip()
+        if not name:
+            return None
+        
         try:
-            result = self.db[CUSTOMERS_COLLECTION].update_one(
+            return self.db[CUSTOMERS_COLLECTION].find_one_and_update(
                 {"village": village, "customer_name": old_name},
-                {"$set": {"customer_name": new_name.strip(), "updated_on": datetime.now()}}
+                {"$set": {"customer_name": name, "updated_on": datetime.now(timezone.utc)}},
+                return_document=ReturnDocument.AFTER
             )
             
-            return result.modified_count > 0
-            
+        except DuplicateKeyError as e:
+            raise DuplicateCustomerError(f"Customer '{name}' already exists in {village}") from e
         except Exception as e:
-            st.error(f"Error updating customer: {str(e)}")
-            return False
+            logger.exception("Error updating customer")
+            raise TeaDBError(f"Error updating customer: {e}") from e
     
     def delete_customer(self, village: str, customer_name: str) -> bool:
         """Delete a customer"""
+        name = customer_name.strip()
+        if not name:
+            return False
+        
         try:
             result = self.db[CUSTOMERS_COLLECTION].delete_one(
-                {"village": village, "customer_name": customer_name.strip()}
+                {"village": village, "customer_name": name}
             )
             
             return result.deleted_count > 0
             
         except Exception as e:
-            st.error(f"Error deleting customer: {str(e)}")
-            return False
+            logger.exception("Error deleting customer")
+            raise TeaDBError(f"Error deleting customer: {e}") from e
     
     # ============================================
     # PRICING OPERATIONS
@@ -264,20 +471,12 @@ class MongoDBManager:
     def get_all_pricing(self) -> Dict[str, int]:
         """Retrieve all pricing information"""
         try:
-            pricing_dict = {}
-            pricing = self.db[PRICING_COLLECTION].find()
-            
-            for item in pricing:
-                package = item.get('package')
-                rate = item.get('rate')
-                if package:
-                    pricing_dict[package] = int(rate)
-            
-            return pricing_dict
+            cursor = self.db[PRICING_COLLECTION].find({}, {"_id": 0, "package": 1, "rate": 1})
+            return {doc["package"]: int(doc["rate"]) for doc in cursor if doc.get("package")}
             
         except Exception as e:
-            st.error(f"Error fetching pricing: {str(e)}")
-            return {}
+            logger.exception("Error fetching pricing")
+            raise TeaDBError(f"Error fetching pricing: {e}") from e
     
     def update_pricing(self, package: str, new_rate: int) -> bool:
         """Update pricing for a package"""
@@ -287,7 +486,7 @@ class MongoDBManager:
                 {
                     "$set": {
                         "rate": new_rate,
-                        "updated_on": datetime.now()
+                        "updated_on": datetime.now(timezone.utc)
                     }
                 },
                 upsert=True
@@ -296,26 +495,25 @@ class MongoDBManager:
             return True
             
         except Exception as e:
-            st.error(f"Error updating pricing: {str(e)}")
-            return False
+            logger.exception("Error updating pricing")
+            raise TeaDBError(f"Error updating pricing: {e}") from e
     
     def initialize_default_pricing(self, default_pricing: Dict[str, int]):
         """Initialize default pricing if not exists"""
         try:
-            for package, rate in default_pricing.items():
-                self.db[PRICING_COLLECTION].update_one(
+            now = datetime.now(timezone.utc)
+            ops = [
+                UpdateOne(
                     {"package": package},
-                    {
-                        "$setOnInsert": {
-                            "package": package,
-                            "rate": rate,
-                            "updated_on": datetime.now()
-                        }
-                    },
+                    {"$setOnInsert": {"package": package, "rate": rate, "updated_on": now}},
                     upsert=True
                 )
+                for package, rate in default_pricing.items()
+            ]
+            if ops:
+                self.db[PRICING_COLLECTION].bulk_write(ops, ordered=False)
         except Exception as e:
-            st.warning(f"Could not initialize default pricing: {str(e)}")
+            logger.warning("Could not initialize default pricing: %s", e)
     
     def close(self):
         """Close MongoDB connection"""
@@ -323,7 +521,7 @@ class MongoDBManager:
             self.client.close()
 
 
-@st.cache_resource
+@lru_cache(maxsize=None)
 def get_mongodb_client():
-    """Get cached MongoDB client instance"""
+    """Get the process-wide MongoDB client instance"""
     return MongoDBManager()
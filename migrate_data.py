@@ -6,12 +6,16 @@ Migrates data from local JSON files to MongoDB
 import os
 import json
 from datetime import datetime
+import ijson
 from dotenv import load_dotenv
 from db_mongodb import get_mongodb_client
 
 # Load environment variables
 load_dotenv()
 
+# Customers sent to MongoDB per bulk insert while streaming the JSON file
+CUSTOMER_BATCH_SIZE = 500
+
 DEFAULT_PRICING = {
     "100gm": 35,
     "250gm": 85,
@@ -26,23 +30,31 @@ def migrate_customers():
     json_path = os.path.join(os.path.dirname(__file__), 'customer_database.json')
     
     try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            customers = json.load(f)
-        
         db_manager = get_mongodb_client()
         migrated_count = 0
+        skipped_count = 0
+        
+        def flush(pairs):
+            # Unordered bulk insert; existing customers are skipped by the unique index
+            nonlocal migrated_count, skipped_count
+            inserted, skipped = db_manager.bulk_add_customers(pairs)
+            migrated_count += inserted
+            skipped_count += skipped
+        
+        # Stream one village at a time instead of loading the whole file
+        with open(json_path, 'rb') as f:
+            pairs = []
+            for village, customer_list in ijson.kvitems(f, ''):
+                for customer_name in customer_list:
+                    pairs.append((village, customer_name))
+                    if len(pairs) >= CUSTOMER_BATCH_SIZE:
+                        flush(pairs)
+                        pairs = []
+            if pairs:
+                flush(pairs)
         
-        for village, customer_list in customers.items():
-            for customer_name in customer_list:
-                customer_name = customer_name.strip()
-                if customer_name:
-                    try:
-                        db_manager.add_customer(village, customer_name)
-                        migrated_count += 1
-                        print(f"  ✅ Added: {customer_name} ({village})")
-                    except Exception as e:
-                        # Customer might already exist
-                        print(f"  ⚠️  Skipped: {customer_name} ({village}) - {str(e)}")
+        if skipped_count:
+            print(f"  ⚠️  Skipped {skipped_count} customers that already exist")
         
         print(f"\n✅ Customer migration complete! Migrated {migrated_count} customers.")
         return True
@@ -108,8 +120,7 @@ def show_summary():
             print(f"   - {package}: ₹{rate}")
         
         # Count sales
-        sales = db_manager.get_all_sales()
-        print(f"\n📈 Sales: {len(sales)} records")
+        print(f"\n📈 Sales: {db_manager.count_sales()} records")
         
         print("\n" + "="*50)
         print("✅ Migration completed successfully!")
@@ -132,6 +143,8 @@ def main():
             print("❌ Failed to connect to MongoDB. Please check your connection settings.")
             return
         print("✅ Connected to MongoDB successfully!")
+        # The unique customer index is what lets duplicates be skipped
+        db_manager.ensure_indexes()
     except Exception as e:
         print(f"❌ Connection error: {str(e)}")
         return
@@ -36,9 +36,9 @@ def test_connection():
             customers = db_manager.get_all_customers()
             print(f"✅ Customers loaded: {len(customers)} villages")
             
-            # Get sales
-            sales = db_manager.get_all_sales()
-            print(f"✅ Sales loaded: {len(sales)} records")
+            # Count sales (no documents are fetched)
+            sales_count = db_manager.count_sales()
+            print(f"✅ Sales found: {sales_count} records")
             
             print("\n🎉 All tests passed! MongoDB is ready to use.")
             return True